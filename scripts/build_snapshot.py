@@ -4,7 +4,8 @@ Build a daily snapshot of Uruguay Open Data catalog health (CKAN-based).
 
 Outputs:
 - data/latest.json
-- data/history/YYYY-MM-DD.json
+- data/history/YYYY-MM-DD.json  # "kind": "delta" (datasets added/removed/changed vs. the
+                                #  previous day) or "kind": "snapshot" (full copy of latest)
 
 Config via env vars:
 - CKAN_BASE_URL (default: https://catalogodatos.gub.uy)
@@ -12,7 +13,10 @@ Config via env vars:
 - MAX_DATASETS (default: 0 -> no limit)
 - REQUEST_TIMEOUT_SECONDS (default: 12)
 - REQUEST_RETRIES (default: 2)
-- REQUEST_DELAY_SECONDS (default: 0.15)
+- REQUEST_DELAY_SECONDS (default: 0.15)  # pause between listing pages, and before each dataset per worker
+- MAX_WORKERS (default: 16)  # datasets processed concurrently
+- RESOURCE_WORKERS (default: 16)  # resource checks in flight, shared by all datasets
+- PACKAGE_PAGE_SIZE (default: 500)  # datasets per current_package_list_with_resources call
 - CSV_SAMPLE_LINES (default: 50)
 - FRESH_GREEN_DAYS (default: 90)
 - FRESH_YELLOW_DAYS (default: 365)
@@ -25,17 +29,27 @@ Notes:
 from __future__ import annotations
 
 import csv
+import functools
 import hashlib
 import io
 import json
 import os
+import shutil
+import ssl
 import sys
+import tempfile
+import threading
 import time
-from dataclasses import dataclass
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from dateutil import parser as date_parser
 
 
@@ -49,15 +63,23 @@ MAX_DATASETS = int(os.getenv("MAX_DATASETS", "0"))  # 0 = no limit
 REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "12"))
 REQUEST_RETRIES = int(os.getenv("REQUEST_RETRIES", "2"))
 REQUEST_DELAY_SECONDS = float(os.getenv("REQUEST_DELAY_SECONDS", "0.15"))
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "16"))
+RESOURCE_WORKERS = int(os.getenv("RESOURCE_WORKERS", "16"))
+PACKAGE_PAGE_SIZE = int(os.getenv("PACKAGE_PAGE_SIZE", "500"))
 
 CSV_SAMPLE_LINES = int(os.getenv("CSV_SAMPLE_LINES", "50"))
+SNIFF_MAX_CHARS = 4096
 
 FRESH_GREEN_DAYS = int(os.getenv("FRESH_GREEN_DAYS", "90"))
 FRESH_YELLOW_DAYS = int(os.getenv("FRESH_YELLOW_DAYS", "365"))
 
+CHECKSUM_ALGO = "sha256"
+
 OUT_DIR_DATA = os.path.join(os.getcwd(), "data")
 OUT_DIR_HISTORY = os.path.join(OUT_DIR_DATA, "history")
 
+_FROMISOFORMAT_ACCEPTS_Z = sys.version_info >= (3, 11)
+
 
 # ----------------------------
 # Helpers
@@ -71,15 +93,28 @@ def ensure_dirs() -> None:
     os.makedirs(OUT_DIR_HISTORY, exist_ok=True)
 
 
+@functools.lru_cache(maxsize=4096)
+def _parse_iso_datetime(value: str) -> datetime:
+    # datetime.fromisoformat (C) covers what CKAN emits; dateutil only gets
+    # the odd shapes it rejects. Before 3.11 it doesn't take a "Z" suffix.
+    try:
+        if not _FROMISOFORMAT_ACCEPTS_Z and value.endswith("Z"):
+            dt = datetime.fromisoformat(value[:-1] + "+00:00")
+        else:
+            dt = datetime.fromisoformat(value)
+    except ValueError:
+        dt = date_parser.isoparse(value)
+    # Normalize naive datetimes as UTC for consistency
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
 def safe_parse_datetime(value: Optional[str]) -> Optional[datetime]:
     if not value:
         return None
     try:
-        dt = date_parser.isoparse(value)
-        # Normalize naive datetimes as UTC for consistency
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt
+        return _parse_iso_datetime(value)
     except Exception:
         return None
 
@@ -102,6 +137,145 @@ def freshness_bucket(days: Optional[int]) -> str:
     return "red"
 
 
+def write_json(path: str, obj: Any, indent: bool = False) -> None:
+    """
+    Write JSON to a temp file and rename it over path. Replacing (rather than
+    truncating) matters because history files may be hardlinks of latest.json.
+    """
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    payload = orjson.dumps(obj, option=option)
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), prefix=".", suffix=".tmp", delete=False
+    ) as f:
+        tmp_path = f.name
+        try:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.chmod(tmp_path, 0o644)  # NamedTemporaryFile creates 0600
+    os.replace(tmp_path, path)
+
+
+def load_previous_snapshot(path: str) -> Optional[dict]:
+    """
+    Load the snapshot from the previous run, if any. A missing or unreadable
+    file just means a full (non-incremental) build.
+    """
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[warn] Ignoring previous snapshot {path}: {e}")
+        return None
+
+
+def index_previous_checks(snapshot: Optional[dict]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """
+    Map resource_check_key -> {"last_modified", "check"} from a previous
+    snapshot. A real check wins over a from_cache copy of the same resource.
+    """
+    prev: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    if not snapshot:
+        return prev
+    for d in snapshot.get("datasets") or []:
+        for r in d.get("resources") or []:
+            chk = r.get("check")
+            if not r.get("url") or not isinstance(chk, dict):
+                continue
+            key = resource_check_key(r)
+            seen = prev.get(key)
+            if seen is None or (seen["check"].get("from_cache") and not chk.get("from_cache")):
+                prev[key] = {"last_modified": r.get("last_modified"), "check": chk}
+    return prev
+
+
+def dataset_signature(ds: dict) -> tuple:
+    """
+    The parts of a dataset entry that count as a change for history purposes.
+    days_since_modified is left out on purpose: it moves every day by itself.
+    """
+    return (
+        ds.get("freshness_bucket"),
+        ds.get("resources_broken"),
+        ds.get("resources_parse_failed"),
+        tuple(_check_checksum(r.get("check")) for r in ds.get("resources") or []),
+    )
+
+
+def _check_checksum(check: Any) -> Optional[str]:
+    # fresh entries hold the ResourceCheckResult itself, loaded snapshots a dict
+    if isinstance(check, ResourceCheckResult):
+        return check.checksum
+    return (check or {}).get("checksum")
+
+
+def index_previous_signatures(snapshot: Optional[dict]) -> Dict[str, tuple]:
+    """
+    Map dataset id -> dataset_signature from a previous snapshot.
+    """
+    if not snapshot:
+        return {}
+    return {d.get("id"): dataset_signature(d) for d in snapshot.get("datasets") or []}
+
+
+def build_history_delta(
+    prev_sigs: Dict[str, tuple],
+    datasets_meta: List[Dict[str, Any]],
+    datasets_out: List[Any],
+) -> Dict[str, Any]:
+    """
+    Diff datasets against the previous snapshot, keyed by dataset id.
+    datasets_meta[i] holds id/signature for the serialized datasets_out[i].
+    Added and changed datasets are stored in full; removed ones by id.
+    """
+    added: List[Any] = []
+    changed: List[Any] = []
+    seen = set()
+    for meta, ds in zip(datasets_meta, datasets_out):
+        seen.add(meta["id"])
+        prev_sig = prev_sigs.get(meta["id"])
+        if prev_sig is None:
+            added.append(ds)
+        elif prev_sig != meta["signature"]:
+            changed.append(ds)
+    removed = [ds_id for ds_id in prev_sigs if ds_id not in seen]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def history_base(prev_date: Optional[str], date_key: str) -> Optional[str]:
+    """
+    Date the history entry for date_key can be a delta against, if any.
+    There is none on the first run, nor on a re-run the same day: the
+    previous snapshot is then today's, and the earlier day it was diffed
+    against is no longer available.
+    """
+    if prev_date and prev_date < date_key:
+        return prev_date
+    return None
+
+
+def link_full_snapshot(latest_path: str, hist_path: str) -> None:
+    """
+    Make the history entry the full snapshot by hardlinking latest.json
+    (copying where links aren't supported). Safe because write_json always
+    replaces latest.json rather than rewriting it in place.
+    """
+    if os.path.exists(hist_path):
+        os.remove(hist_path)
+    try:
+        os.link(latest_path, hist_path)
+    except OSError:
+        shutil.copyfile(latest_path, hist_path)
+
+
 def action_url(action: str) -> str:
     return f"{CKAN_BASE_URL}{CKAN_API_PATH}/{action}"
 
@@ -134,33 +308,79 @@ class ResourceCheckResult:
     parse_ok: Optional[bool]  # None if not attempted
     parse_error: Optional[str]
     checksum: Optional[str]
+    checksum_algo: Optional[str] = None
+    etag: Optional[str] = None
+    from_cache: bool = False  # copied from an earlier check of the same URL this run
 
 
 def headish_download(
     session: requests.Session,
     url: str,
     max_bytes: int = 1024 * 512,  # 512KB
-) -> Tuple[int, bytes]:
+    headers: Optional[dict] = None,
+) -> Tuple[int, bytearray, Optional[str]]:
     """
-    Stream-download up to max_bytes. Returns (status_code, content_bytes).
+    Download up to max_bytes. Returns (status_code, content_bytes, etag).
+
+    Asks the server for just that byte range (206). Servers that ignore Range
+    answer 200 with the full body, so the read is still capped client-side.
     """
-    resp = session.get(url, stream=True, timeout=REQUEST_TIMEOUT_SECONDS, allow_redirects=True)
-    status = resp.status_code
-    content = b""
-    try:
+    req_headers = dict(headers or {})
+    req_headers["Range"] = f"bytes=0-{max_bytes - 1}"
+    resp = session.get(
+        url, headers=req_headers, stream=True, timeout=REQUEST_TIMEOUT_SECONDS, allow_redirects=True
+    )
+    if resp.status_code == 416:
+        # Range not satisfiable, i.e. an empty body; ask again without Range
+        resp.close()
+        del req_headers["Range"]
+        resp = session.get(
+            url, headers=req_headers, stream=True, timeout=REQUEST_TIMEOUT_SECONDS, allow_redirects=True
+        )
+
+    # Closing a response returns its connection to the session pool only if
+    # the body was read to the end; otherwise the socket is dropped.
+    with resp:
+        status = resp.status_code
+        etag = resp.headers.get("ETag")
+        content = bytearray()
         resp.raise_for_status()
+        # iter_content yields decoded bytes (gzip/br undone), so max_bytes
+        # caps the sample we parse, not the bytes on the wire.
         for chunk in resp.iter_content(chunk_size=65536):
-            if not chunk:
-                continue
-            remaining = max_bytes - len(content)
-            if remaining <= 0:
+            # slicing past the end returns the chunk itself, no copy
+            content.extend(chunk[: max_bytes - len(content)])
+            # A 206 body is bounded by the Range, so finish it and keep the
+            # connection. A 200 (Range ignored) may be huge: stop at the cap
+            # and let close() drop the connection.
+            if len(content) >= max_bytes and status != 206:
                 break
-            content += chunk[:remaining]
-            if len(content) >= max_bytes:
-                break
-    finally:
-        resp.close()
-    return status, content
+    return status, content, etag
+
+
+def _end_of_line(buf: Any, n: int) -> int:
+    """
+    Index just past the n-th newline in buf (bytes or str), or len(buf).
+    """
+    newline = b"\n" if isinstance(buf, (bytes, bytearray)) else "\n"
+    pos = 0
+    for _ in range(n):
+        idx = buf.find(newline, pos)
+        if idx < 0:
+            return len(buf)
+        pos = idx + 1
+    return pos
+
+
+def sniff_dialect(text: str) -> Any:
+    """
+    csv.Sniffer on at most SNIFF_MAX_CHARS: its regexes can backtrack
+    catastrophically on long inputs, so the cap is what bounds the cost.
+    """
+    try:
+        return csv.Sniffer().sniff(text[:SNIFF_MAX_CHARS])
+    except Exception:
+        return csv.excel
 
 
 def try_parse_csv(sample: bytes) -> Tuple[bool, Optional[str]]:
@@ -168,20 +388,18 @@ def try_parse_csv(sample: bytes) -> Tuple[bool, Optional[str]]:
     Parse a small CSV sample. We don't enforce schema, only readability.
     """
     try:
-        text = sample.decode("utf-8", errors="replace")
-        # Take first N lines
-        lines = text.splitlines()[:CSV_SAMPLE_LINES]
-        if not lines:
+        # Take first N lines, cut on raw bytes (BytesIO below copies just this head)
+        head = memoryview(sample)[: _end_of_line(sample, CSV_SAMPLE_LINES)]
+        if not head:
             return False, "empty sample"
-        buf = io.StringIO("\n".join(lines))
 
-        # Sniff delimiter if possible
-        sample_for_sniff = "\n".join(lines[:10])
-        try:
-            dialect = csv.Sniffer().sniff(sample_for_sniff)
-        except Exception:
-            dialect = csv.excel
+        # Sniff delimiter if possible; only this small prefix becomes a str
+        sniff_end = min(_end_of_line(sample, 10), len(head), SNIFF_MAX_CHARS)
+        sample_for_sniff = str(head[:sniff_end], "utf-8", "replace")
+        dialect = sniff_dialect(sample_for_sniff)
 
+        # the reader decodes incrementally and stops after the rows we ask for
+        buf = io.TextIOWrapper(io.BytesIO(head), encoding="utf-8", errors="replace", newline="")
         reader = csv.reader(buf, dialect)
         # Read a few rows
         _ = next(reader, None)
@@ -192,19 +410,38 @@ def try_parse_csv(sample: bytes) -> Tuple[bool, Optional[str]]:
 
 
 def try_parse_json(sample: bytes) -> Tuple[bool, Optional[str]]:
+    # orjson validates straight from bytes (strict UTF-8) far faster than the
+    # stdlib. It is stricter though (no NaN, no ints beyond 64 bits), so only
+    # its failures get a second opinion from json.
+    try:
+        orjson.loads(sample)
+        return True, None
+    except orjson.JSONDecodeError:
+        pass
     try:
-        text = sample.decode("utf-8", errors="strict")
-        json.loads(text)
+        # strict UTF-8 like orjson; json.loads(bytes) would also accept UTF-16/BOM
+        json.loads(sample.decode("utf-8", errors="strict"))
         return True, None
     except Exception as e:
         return False, str(e)
 
 
 def checksum_sha256(sample: bytes) -> str:
+    # hashlib's sha256 is OpenSSL's, which uses the CPU's SHA extensions
+    # where available; fast enough that no extra dependency is warranted.
     return hashlib.sha256(sample).hexdigest()
 
 
-def check_resource(session: requests.Session, resource: dict) -> ResourceCheckResult:
+def check_resource(
+    session: requests.Session,
+    resource: dict,
+    prev_check: Optional[dict] = None,
+) -> ResourceCheckResult:
+    """
+    prev_check is the resource's check from the previous snapshot, passed only
+    when the resource is unchanged in CKAN. If it carries an ETag we revalidate
+    with If-None-Match and reuse it on 304 instead of downloading again.
+    """
     url = resource.get("url")
     fmt = (resource.get("format") or "").strip().lower()
 
@@ -219,10 +456,28 @@ def check_resource(session: requests.Session, resource: dict) -> ResourceCheckRe
             checksum=None,
         )
 
+    headers = None
+    # Snapshots written before checksum_algo existed were all sha256.
+    if prev_check and prev_check.get("etag") and prev_check.get("checksum_algo", CHECKSUM_ALGO) == CHECKSUM_ALGO:
+        headers = {"If-None-Match": prev_check["etag"]}
+
     try:
-        status, content = headish_download(session, url)
+        status, content, etag = headish_download(session, url, headers=headers)
         bytes_read = len(content)
 
+        if status == 304 and prev_check is not None:
+            return ResourceCheckResult(
+                ok=prev_check.get("ok", False),
+                http_status=prev_check.get("http_status"),
+                error=prev_check.get("error"),
+                bytes_read=0,
+                parse_ok=prev_check.get("parse_ok"),
+                parse_error=prev_check.get("parse_error"),
+                checksum=prev_check.get("checksum"),
+                etag=etag or prev_check.get("etag"),
+                checksum_algo=CHECKSUM_ALGO if prev_check.get("checksum") else None,
+            )
+
         if status < 200 or status >= 300:
             return ResourceCheckResult(
                 ok=False,
@@ -232,6 +487,7 @@ def check_resource(session: requests.Session, resource: dict) -> ResourceCheckRe
                 parse_ok=None,
                 parse_error=None,
                 checksum=None,
+                etag=etag,
             )
 
         # Basic format validation only for CSV/JSON in v1
@@ -243,7 +499,9 @@ def check_resource(session: requests.Session, resource: dict) -> ResourceCheckRe
         elif fmt == "json":
             parse_ok, parse_error = try_parse_json(content)
 
-        # checksum is useful for change tracking later (cheap now)
+        # checksum is useful for change tracking later (cheap now). Parsing and
+        # hashing stay inline: checks already run on worker threads, so this
+        # CPU work overlaps other resources' downloads (hashlib drops the GIL).
         chksum = checksum_sha256(content) if content else None
 
         ok = True
@@ -258,6 +516,8 @@ def check_resource(session: requests.Session, resource: dict) -> ResourceCheckRe
             parse_ok=parse_ok,
             parse_error=parse_error,
             checksum=chksum,
+            etag=etag,
+            checksum_algo=CHECKSUM_ALGO if chksum else None,
         )
 
     except Exception as e:
@@ -272,6 +532,64 @@ def check_resource(session: requests.Session, resource: dict) -> ResourceCheckRe
         )
 
 
+def canonical_url(url: str) -> str:
+    """
+    Normalize a resource URL for de-duplication: scheme and host are
+    case-insensitive and the fragment never reaches the server. Path and
+    query are case-sensitive, so they are left as-is.
+    """
+    parts = urlsplit(url.strip())
+    return parts._replace(netloc=parts.netloc.lower(), fragment="").geturl()
+
+
+def resource_check_key(resource: dict) -> Tuple[str, str]:
+    """
+    (canonical url, format) identifying one check of a resource with a url.
+    """
+    return canonical_url(resource["url"]), (resource.get("format") or "").strip().lower()
+
+
+class ResourceCheckCache:
+    """
+    Per-run cache of resource checks keyed by (canonical url, format), so a URL
+    listed by several datasets is only downloaded once. A lookup that races an
+    in-flight check of the same key waits for it instead of starting another.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._futures: Dict[Tuple[str, str], Future] = {}
+
+    def check(
+        self,
+        session: requests.Session,
+        resource: dict,
+        prev_check: Optional[dict] = None,
+    ) -> ResourceCheckResult:
+        url = resource.get("url")
+        if not url:
+            return check_resource(session, resource, prev_check)
+
+        key = resource_check_key(resource)
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._futures[key] = future
+
+        if not owner:
+            return replace(future.result(), bytes_read=0, from_cache=True)
+
+        try:
+            result = check_resource(session, resource, prev_check)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+
 def dataset_last_modified(dataset: dict) -> Optional[datetime]:
     """
     Prefer dataset-level timestamps; fallback to newest resource last_modified.
@@ -289,12 +607,182 @@ def dataset_last_modified(dataset: dict) -> Optional[datetime]:
             return dt
 
     # fallback: resources
-    newest: Optional[datetime] = None
-    for r in dataset.get("resources", []) or []:
-        dt = safe_parse_datetime(r.get("last_modified") or r.get("metadata_modified") or r.get("created"))
-        if dt and (newest is None or dt > newest):
-            newest = dt
-    return newest
+    parsed = (
+        safe_parse_datetime(r.get("last_modified") or r.get("metadata_modified") or r.get("created"))
+        for r in dataset.get("resources") or ()
+    )
+    return max((dt for dt in parsed if dt), default=None)
+
+
+def fetch_datasets(session: requests.Session) -> Tuple[List[dict], List[Dict[str, Any]]]:
+    """
+    List datasets with their resources, one page of package dicts per request
+    via current_package_list_with_resources. Returns (datasets, errors).
+
+    CKAN serves that action from package_search sorted by metadata_modified,
+    so a dataset edited while we page shifts the offsets: it can show up
+    twice (dropped here by id) and push another one past us. Without
+    MAX_DATASETS, package_list is used to pick up any names the pages missed;
+    it also covers a failed page or a CKAN without the paged action. Those
+    entries carry only a name and are completed with package_show by
+    process_dataset.
+    """
+    datasets: List[dict] = []
+    errors: List[Dict[str, Any]] = []
+    seen_ids = set()
+    seen_names = set()
+    offset = 0
+    try:
+        while MAX_DATASETS <= 0 or len(datasets) < MAX_DATASETS:
+            limit = PACKAGE_PAGE_SIZE
+            if MAX_DATASETS > 0:
+                limit = min(limit, MAX_DATASETS - len(datasets))
+            if offset and REQUEST_DELAY_SECONDS > 0:
+                time.sleep(REQUEST_DELAY_SECONDS)
+            page = http_get_json(
+                session,
+                action_url("current_package_list_with_resources"),
+                params={"limit": limit, "offset": offset},
+            )["result"]
+            if not isinstance(page, list):
+                raise RuntimeError("Unexpected current_package_list_with_resources result shape")
+            if not page:
+                break
+            offset += len(page)
+            for ds in page:
+                ds_id = ds.get("id") or ds.get("name")
+                if ds_id in seen_ids:
+                    continue
+                seen_ids.add(ds_id)
+                seen_names.add(ds.get("name"))
+                datasets.append(ds)
+        if MAX_DATASETS > 0:
+            return datasets, errors
+    except Exception as e:
+        print(f"[warn] current_package_list_with_resources failed at offset {offset} ({e}); using package_list")
+        if datasets:
+            errors.append({"dataset": f"current_package_list_with_resources?offset={offset}", "error": str(e)})
+
+    try:
+        packages = http_get_json(session, action_url("package_list"))["result"]
+        if not isinstance(packages, list):
+            raise RuntimeError("Unexpected package_list result shape")
+    except Exception as e:
+        if not datasets:
+            raise
+        # keep what the pages gave us rather than failing the whole run
+        errors.append({"dataset": "package_list", "error": str(e)})
+        return datasets, errors
+
+    missing = [pkg_id for pkg_id in packages if pkg_id not in seen_names]
+    if MAX_DATASETS > 0:
+        missing = missing[: max(0, MAX_DATASETS - len(datasets))]
+    if missing and datasets:
+        print(f"[info] {len(missing)} datasets missing from paged listing; fetching with package_show")
+    datasets.extend({"name": pkg_id} for pkg_id in missing)
+    return datasets, errors
+
+
+def process_dataset(
+    session: requests.Session,
+    ds: dict,
+    now: datetime,
+    prev_checks: Dict[Tuple[str, str], Dict[str, Any]],
+    check_cache: ResourceCheckCache,
+    resource_executor: ThreadPoolExecutor,
+) -> Dict[str, Any]:
+    """
+    Check one dataset and its resources. Runs inside a worker thread.
+    """
+    pkg_id = ds.get("name") or ds.get("id")
+
+    # Politeness delay between datasets, per worker slot: at most MAX_WORKERS
+    # datasets start per REQUEST_DELAY_SECONDS window, which paces both the
+    # package_show fallback and the resource downloads (mostly one host).
+    if REQUEST_DELAY_SECONDS > 0:
+        time.sleep(REQUEST_DELAY_SECONDS)
+
+    if "resources" not in ds or "organization" not in ds:
+        # Paged listing didn't give us the full dict; ask for it explicitly.
+        ds = http_get_json(session, action_url("package_show"), params={"id": pkg_id})["result"]
+
+    ds_name = ds.get("name") or str(pkg_id)
+    ds_title = ds.get("title") or ds_name
+
+    org = ds.get("organization") or {}
+    org_id = org.get("id") or "unknown"
+    org_name = org.get("name") or "unknown"
+    org_title = org.get("title") or org_name
+
+    last_mod_dt = dataset_last_modified(ds)
+    last_mod_iso = last_mod_dt.isoformat() if last_mod_dt else None
+    d_since = days_since(last_mod_dt, now)
+    bucket = freshness_bucket(d_since)
+
+    resources = ds.get("resources", []) or []
+    res_out: List[Dict[str, Any]] = []
+    formats = set()
+    broken = 0
+    parse_failed = 0
+
+    # Submit every resource check to the shared pool up front, then collect
+    # them in order so res_out matches the CKAN resource order.
+    pending = []
+    for r in resources:
+        r_url = r.get("url")
+        r_last_mod = safe_parse_datetime(r.get("last_modified") or r.get("metadata_modified"))
+        r_last_mod_iso = r_last_mod.isoformat() if r_last_mod else None
+
+        # Only revalidate against the previous check if CKAN says the
+        # resource hasn't changed since then.
+        prev = prev_checks.get(resource_check_key(r)) if r_url else None
+        prev_check = prev["check"] if prev and prev["last_modified"] == r_last_mod_iso else None
+
+        pending.append((r, r_last_mod_iso, resource_executor.submit(check_cache.check, session, r, prev_check)))
+
+    for r, r_last_mod_iso, chk_future in pending:
+        r_id = r.get("id") or ""
+        r_name = r.get("name") or r.get("description") or r_id
+        r_url = r.get("url")
+        r_fmt = (r.get("format") or "").strip()
+        if r_fmt:
+            formats.add(r_fmt.lower())
+
+        chk = chk_future.result()
+
+        if not chk.ok:
+            broken += 1
+            if chk.error == "parse_failed":
+                parse_failed += 1
+
+        res_out.append(
+            {
+                "id": r_id,
+                "name": r_name,
+                "format": r_fmt,
+                "url": r_url,
+                "last_modified": r_last_mod_iso,
+                # orjson serializes the dataclass natively, so no per-resource
+                # dict copy of the check is built.
+                "check": chk,
+            }
+        )
+
+    return {
+        "id": ds.get("id") or ds_name,
+        "name": ds_name,
+        "title": ds_title,
+        "organization": {"id": org_id, "name": org_name, "title": org_title},
+        "last_modified": last_mod_iso,
+        "days_since_modified": d_since,
+        "freshness_bucket": bucket,
+        "resources_total": len(resources),
+        "resources_broken": broken,
+        "resources_parse_failed": parse_failed,
+        "formats": sorted(formats),
+        "resources": res_out,
+        "catalog_url": f"{CKAN_BASE_URL}/dataset/{ds_name}",
+    }
 
 
 # ----------------------------
@@ -310,106 +798,95 @@ def main() -> int:
             "User-Agent": "observatorio-datos-abiertos/0.1 (+https://github.com/despinoUY/observatorio-datos-abiertos)"
         }
     )
+    # Size the pool for the worker threads so connections (and TLS sessions)
+    # are reused instead of being dropped once the default 10 slots fill up.
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=max(32, MAX_WORKERS + RESOURCE_WORKERS), max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
 
-    # 1) List datasets
-    print(f"[info] Fetching package_list from {action_url('package_list')}")
-    packages = http_get_json(session, action_url("package_list"))["result"]
-    if not isinstance(packages, list):
-        raise RuntimeError("Unexpected package_list result shape")
+    print(f"[info] Resource checksums: {CHECKSUM_ALGO} ({ssl.OPENSSL_VERSION})")
 
-    if MAX_DATASETS > 0:
-        packages = packages[:MAX_DATASETS]
+    latest_path = os.path.join(OUT_DIR_DATA, "latest.json")
+    prev_snapshot = load_previous_snapshot(latest_path)
+    prev_checks = index_previous_checks(prev_snapshot)
+    prev_sigs = index_previous_signatures(prev_snapshot)
+    prev_date = (((prev_snapshot or {}).get("meta") or {}).get("generated_at") or "")[:10]
+    del prev_snapshot  # only the indexes above are needed from here on
+    if prev_checks:
+        print(f"[info] Loaded {len(prev_checks)} resource checks from previous snapshot")
+
+    # 1) List datasets
+    print(f"[info] Fetching datasets from {action_url('current_package_list_with_resources')}")
+    packages, list_errors = fetch_datasets(session)
 
-    print(f"[info] Datasets to process: {len(packages)}")
+    total_packages = len(packages)
+    print(f"[info] Datasets to process: {total_packages}")
 
     org_agg: Dict[str, Dict[str, Any]] = {}
-    datasets_out: List[Dict[str, Any]] = []
-    errors: List[Dict[str, Any]] = []
+    # Each dataset is serialized as soon as it's consumed, and its future and
+    # raw CKAN dict are released with it, so the full dicts (and their resource
+    # lists) don't all stay alive until the end of the run.
+    # datasets_meta keeps the id/signature the history delta needs.
+    datasets_out: List[orjson.Fragment] = []
+    datasets_meta: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = list(list_errors)
+    seen_ids = set()
+
+    # summary counters, kept up to date as datasets complete
+    buckets: Counter = Counter()
+    res_total = res_broken = res_parse_failed = 0
+
+    # Datasets are independent and the work is I/O-bound, so fan out over a
+    # bounded pool; results are consumed in catalog order to keep output stable.
+    # Resource checks get their own pool (shared by all datasets) so a dataset
+    # with many resources doesn't check them one by one.
+    # The pools are shut down explicitly rather than with a with-block, whose
+    # exit would wait for every submitted dataset even on Ctrl-C or an error.
+    executor = ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS))
+    resource_executor = ThreadPoolExecutor(max_workers=max(1, RESOURCE_WORKERS), thread_name_prefix="resource")
+    check_cache = ResourceCheckCache()
+    try:
+        pending = deque(
+            (ds, executor.submit(process_dataset, session, ds, now, prev_checks, check_cache, resource_executor))
+            for ds in packages
+        )
+        del packages  # pending now holds the only references
+
+        idx = 0
+        while pending:
+            ds, fut = pending.popleft()
+            idx += 1
+            try:
+                ds_out = fut.result()
+            except Exception as e:
+                err = {"dataset": str(ds.get("name") or ds.get("id")), "error": str(e)}
+                errors.append(err)
+                # continue
+                continue
 
-    for idx, pkg_id in enumerate(packages, start=1):
-        if REQUEST_DELAY_SECONDS > 0:
-            time.sleep(REQUEST_DELAY_SECONDS)
+            # a package_show fallback can resolve to a dataset we already have
+            if ds_out["id"] in seen_ids:
+                continue
+            seen_ids.add(ds_out["id"])
 
-        try:
-            data = http_get_json(session, action_url("package_show"), params={"id": pkg_id})
-            ds = data["result"]
-
-            ds_name = ds.get("name") or str(pkg_id)
-            ds_title = ds.get("title") or ds_name
-
-            org = ds.get("organization") or {}
-            org_id = org.get("id") or "unknown"
-            org_name = org.get("name") or "unknown"
-            org_title = org.get("title") or org_name
-
-            last_mod_dt = dataset_last_modified(ds)
-            last_mod_iso = last_mod_dt.isoformat() if last_mod_dt else None
-            d_since = days_since(last_mod_dt, now)
-            bucket = freshness_bucket(d_since)
-
-            resources = ds.get("resources", []) or []
-            res_out: List[Dict[str, Any]] = []
-            broken = 0
-            parse_failed = 0
-
-            for r in resources:
-                r_id = r.get("id") or ""
-                r_name = r.get("name") or r.get("description") or r_id
-                r_url = r.get("url")
-                r_fmt = (r.get("format") or "").strip()
-                r_last_mod = safe_parse_datetime(r.get("last_modified") or r.get("metadata_modified"))
-                r_last_mod_iso = r_last_mod.isoformat() if r_last_mod else None
-
-                chk = check_resource(session, r)
-
-                if not chk.ok:
-                    broken += 1
-                    if chk.error == "parse_failed":
-                        parse_failed += 1
-
-                res_out.append(
-                    {
-                        "id": r_id,
-                        "name": r_name,
-                        "format": r_fmt,
-                        "url": r_url,
-                        "last_modified": r_last_mod_iso,
-                        "check": {
-                            "ok": chk.ok,
-                            "http_status": chk.http_status,
-                            "error": chk.error,
-                            "bytes_read": chk.bytes_read,
-                            "parse_ok": chk.parse_ok,
-                            "parse_error": chk.parse_error,
-                            "checksum": chk.checksum,
-                        },
-                    }
-                )
-
-            ds_out = {
-                "id": ds.get("id") or ds_name,
-                "name": ds_name,
-                "title": ds_title,
-                "organization": {"id": org_id, "name": org_name, "title": org_title},
-                "last_modified": last_mod_iso,
-                "days_since_modified": d_since,
-                "freshness_bucket": bucket,
-                "resources_total": len(resources),
-                "resources_broken": broken,
-                "resources_parse_failed": parse_failed,
-                "formats": sorted({(r.get("format") or "").strip().lower() for r in resources if r.get("format")}),
-                "resources": res_out,
-                "catalog_url": f"{CKAN_BASE_URL}/dataset/{ds_name}",
-            }
-            datasets_out.append(ds_out)
+            datasets_out.append(orjson.Fragment(orjson.dumps(ds_out)))
+            datasets_meta.append({"id": ds_out["id"], "signature": dataset_signature(ds_out)})
+
+            bucket = ds_out["freshness_bucket"]
+            buckets[bucket] += 1
+            res_total += ds_out["resources_total"]
+            res_broken += ds_out["resources_broken"]
+            res_parse_failed += ds_out["resources_parse_failed"]
 
             # org aggregation
+            org = ds_out["organization"]
+            org_id = org["id"]
             agg = org_agg.setdefault(
                 org_id,
                 {
                     "id": org_id,
-                    "name": org_name,
-                    "title": org_title,
+                    "name": org["name"],
+                    "title": org["title"],
                     "datasets_total": 0,
                     "datasets_green": 0,
                     "datasets_yellow": 0,
@@ -422,30 +899,22 @@ def main() -> int:
             )
             agg["datasets_total"] += 1
             agg[f"datasets_{bucket}"] = agg.get(f"datasets_{bucket}", 0) + 1  # handles unknown too
-            agg["resources_total"] += len(resources)
-            agg["resources_broken"] += broken
-            agg["resources_parse_failed"] += parse_failed
+            agg["resources_total"] += ds_out["resources_total"]
+            agg["resources_broken"] += ds_out["resources_broken"]
+            agg["resources_parse_failed"] += ds_out["resources_parse_failed"]
 
             if idx % 50 == 0:
-                print(f"[info] Processed {idx}/{len(packages)} datasets...")
-
-        except Exception as e:
-            err = {"dataset": str(pkg_id), "error": str(e)}
-            errors.append(err)
-            # continue
-            continue
-
-    # summary
-    total = len(datasets_out)
-    green = sum(1 for d in datasets_out if d["freshness_bucket"] == "green")
-    yellow = sum(1 for d in datasets_out if d["freshness_bucket"] == "yellow")
-    red = sum(1 for d in datasets_out if d["freshness_bucket"] == "red")
-    unknown = sum(1 for d in datasets_out if d["freshness_bucket"] == "unknown")
-    res_total = sum(d["resources_total"] for d in datasets_out)
-    res_broken = sum(d["resources_broken"] for d in datasets_out)
-    res_parse_failed = sum(d["resources_parse_failed"] for d in datasets_out)
+                print(f"[info] Processed {idx}/{total_packages} datasets...")
+    except BaseException:
+        # drop queued work and re-raise now instead of draining the pools
+        executor.shutdown(wait=False, cancel_futures=True)
+        resource_executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    resource_executor.shutdown()
 
     snapshot = {
+        "kind": "snapshot",
         "meta": {
             "generated_at": utc_now_iso(),
             "ckan_base_url": CKAN_BASE_URL,
@@ -454,11 +923,11 @@ def main() -> int:
             "note": "MVP snapshot: dataset freshness + resource availability + basic CSV/JSON parsing.",
         },
         "summary": {
-            "datasets_total": total,
-            "datasets_green": green,
-            "datasets_yellow": yellow,
-            "datasets_red": red,
-            "datasets_unknown": unknown,
+            "datasets_total": len(datasets_out),
+            "datasets_green": buckets["green"],
+            "datasets_yellow": buckets["yellow"],
+            "datasets_red": buckets["red"],
+            "datasets_unknown": buckets["unknown"],
             "resources_total": res_total,
             "resources_broken": res_broken,
             "resources_parse_failed": res_parse_failed,
@@ -470,18 +939,31 @@ def main() -> int:
     }
 
     # write files
-    latest_path = os.path.join(OUT_DIR_DATA, "latest.json")
     date_key = now.date().isoformat()
     hist_path = os.path.join(OUT_DIR_HISTORY, f"{date_key}.json")
 
-    with open(latest_path, "w", encoding="utf-8") as f:
-        json.dump(snapshot, f, ensure_ascii=False, indent=2)
-
-    with open(hist_path, "w", encoding="utf-8") as f:
-        json.dump(snapshot, f, ensure_ascii=False, indent=2)
-
+    write_json(latest_path, snapshot, indent=True)
     print(f"[ok] Wrote {latest_path}")
-    print(f"[ok] Wrote {hist_path}")
+
+    base = history_base(prev_date, date_key)
+    if base:
+        # history only records what moved since the previous snapshot
+        history = {
+            "kind": "delta",
+            "date": date_key,
+            "base": base,
+            "summary": snapshot["summary"],
+            "delta": build_history_delta(prev_sigs, datasets_meta, datasets_out),
+        }
+        write_json(hist_path, history)
+        delta = history["delta"]
+        print(
+            f"[ok] Wrote {hist_path} (delta vs {history['base']}: "
+            f"+{len(delta['added'])} -{len(delta['removed'])} ~{len(delta['changed'])})"
+        )
+    else:
+        link_full_snapshot(latest_path, hist_path)
+        print(f"[ok] Wrote {hist_path} (full snapshot)")
     print(f"[ok] Summary: {snapshot['summary']}")
 
     return 0
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# build_snapshot is a standalone script, not an installed package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
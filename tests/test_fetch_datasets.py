@@ -0,0 +1,75 @@
+import pytest
+
+import build_snapshot as bs
+
+
+def fake_api(pages, package_list=None, fail_page=None):
+    """
+    Stand-in for http_get_json: serves current_package_list_with_resources
+    from a list of pages (indexed by call, not offset) and package_list.
+    """
+    calls = {"pages": 0}
+
+    def http_get_json(session, url, params=None):
+        if url.endswith("/current_package_list_with_resources"):
+            i = calls["pages"]
+            calls["pages"] += 1
+            if i == fail_page:
+                raise RuntimeError("boom")
+            return {"success": True, "result": pages[i] if i < len(pages) else []}
+        if url.endswith("/package_list"):
+            if package_list is None:
+                raise RuntimeError("package_list down")
+            return {"success": True, "result": package_list}
+        raise AssertionError(url)
+
+    return http_get_json
+
+
+@pytest.fixture(autouse=True)
+def no_delay(monkeypatch):
+    monkeypatch.setattr(bs, "REQUEST_DELAY_SECONDS", 0)
+    monkeypatch.setattr(bs, "MAX_DATASETS", 0)
+
+
+def ds(i):
+    return {"id": f"id{i}", "name": f"n{i}", "resources": [], "organization": {}}
+
+
+def test_duplicates_across_pages_are_dropped_and_missed_names_recovered(monkeypatch):
+    # n1 was edited mid-run: it shows up on both pages and pushes n2 out
+    pages = [[ds(0), ds(1)], [ds(1), ds(3)]]
+    monkeypatch.setattr(bs, "http_get_json", fake_api(pages, ["n0", "n1", "n2", "n3"]))
+
+    datasets, errors = bs.fetch_datasets(None)
+
+    assert [d["name"] for d in datasets] == ["n0", "n1", "n3", "n2"]
+    assert datasets[-1] == {"name": "n2"}  # completed later via package_show
+    assert errors == []
+
+
+def test_failed_later_page_keeps_earlier_pages(monkeypatch):
+    monkeypatch.setattr(bs, "http_get_json", fake_api([[ds(0), ds(1)]], ["n0", "n1", "n2"], fail_page=1))
+
+    datasets, errors = bs.fetch_datasets(None)
+
+    assert [d["name"] for d in datasets] == ["n0", "n1", "n2"]
+    assert len(errors) == 1 and "offset=2" in errors[0]["dataset"]
+
+
+def test_failed_later_page_without_package_list_records_errors(monkeypatch):
+    monkeypatch.setattr(bs, "http_get_json", fake_api([[ds(0)]], None, fail_page=1))
+
+    datasets, errors = bs.fetch_datasets(None)
+
+    assert [d["name"] for d in datasets] == ["n0"]
+    assert [e["dataset"] for e in errors] == ["current_package_list_with_resources?offset=1", "package_list"]
+
+
+def test_falls_back_to_package_list_when_paging_unavailable(monkeypatch):
+    monkeypatch.setattr(bs, "http_get_json", fake_api([], ["a", "b"], fail_page=0))
+
+    datasets, errors = bs.fetch_datasets(None)
+
+    assert datasets == [{"name": "a"}, {"name": "b"}]
+    assert errors == []
@@ -0,0 +1,78 @@
+import os
+
+import orjson
+
+import build_snapshot as bs
+
+
+def ds(ds_id, bucket="green", broken=0, parse_failed=0, checksums=("a",)):
+    return {
+        "id": ds_id,
+        "freshness_bucket": bucket,
+        "days_since_modified": 3,
+        "resources_broken": broken,
+        "resources_parse_failed": parse_failed,
+        "resources": [{"check": {"checksum": c}} for c in checksums],
+    }
+
+
+def delta(prev, current):
+    prev_sigs = bs.index_previous_signatures({"datasets": prev})
+    meta = [{"id": d["id"], "signature": bs.dataset_signature(d)} for d in current]
+    return bs.build_history_delta(prev_sigs, meta, current)
+
+
+def test_signature_ignores_days_since_modified():
+    a = ds("x")
+    b = dict(a, days_since_modified=400)
+    assert bs.dataset_signature(a) == bs.dataset_signature(b)
+
+
+def test_signature_reads_fresh_check_results_and_loaded_dicts_alike():
+    loaded = ds("x", checksums=("abc",))
+    fresh = dict(loaded, resources=[{"check": bs.ResourceCheckResult(True, 200, None, 1, None, None, "abc")}])
+    assert bs.dataset_signature(fresh) == bs.dataset_signature(loaded)
+
+
+def test_delta_reports_added_removed_and_changed():
+    prev = [ds("same"), ds("gone"), ds("bucket"), ds("broken"), ds("content")]
+    current = [
+        ds("same"),
+        ds("bucket", bucket="red"),
+        ds("broken", broken=1),
+        ds("content", checksums=("b",)),
+        ds("new"),
+    ]
+
+    result = delta(prev, current)
+
+    assert [d["id"] for d in result["added"]] == ["new"]
+    assert result["removed"] == ["gone"]
+    assert [d["id"] for d in result["changed"]] == ["bucket", "broken", "content"]
+
+
+def test_delta_is_empty_when_nothing_moved():
+    assert delta([ds("a"), ds("b")], [ds("a"), ds("b")]) == {"added": [], "removed": [], "changed": []}
+
+
+def test_history_base_only_for_an_earlier_day():
+    assert bs.history_base("2024-05-01", "2024-05-02") == "2024-05-01"
+    assert bs.history_base("2024-05-02", "2024-05-02") is None  # re-run the same day
+    assert bs.history_base("", "2024-05-02") is None  # first run
+    assert bs.history_base(None, "2024-05-02") is None
+
+
+def test_full_snapshot_link_survives_rewriting_latest(tmp_path):
+    latest = str(tmp_path / "latest.json")
+    hist = str(tmp_path / "2024-05-02.json")
+    bs.write_json(latest, {"kind": "snapshot", "n": 1})
+    with open(hist, "w") as f:
+        f.write("stale")
+
+    bs.link_full_snapshot(latest, hist)
+    assert os.path.samefile(latest, hist)
+
+    # the next run replaces latest.json; the history entry must keep day 1
+    bs.write_json(latest, {"kind": "snapshot", "n": 2})
+    with open(hist, "rb") as f:
+        assert orjson.loads(f.read()) == {"kind": "snapshot", "n": 1}
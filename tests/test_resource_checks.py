@@ -0,0 +1,142 @@
+import threading
+
+import build_snapshot as bs
+
+
+def result(**kw):
+    base = dict(ok=True, http_status=200, error=None, bytes_read=10, parse_ok=None, parse_error=None, checksum="c")
+    base.update(kw)
+    return bs.ResourceCheckResult(**base)
+
+
+def test_cache_checks_each_url_once(monkeypatch):
+    calls = []
+
+    def fake_check(session, resource, prev_check=None):
+        calls.append(resource["url"])
+        return result()
+
+    monkeypatch.setattr(bs, "check_resource", fake_check)
+    cache = bs.ResourceCheckCache()
+
+    first = cache.check(None, {"url": "HTTP://Example.org/a.csv#frag", "format": "CSV"})
+    again = cache.check(None, {"url": "http://example.org/a.csv", "format": "csv "})
+    other_path = cache.check(None, {"url": "http://example.org/A.csv", "format": "csv"})
+    other_format = cache.check(None, {"url": "http://example.org/a.csv", "format": "json"})
+
+    assert calls == ["HTTP://Example.org/a.csv#frag", "http://example.org/A.csv", "http://example.org/a.csv"]
+    assert (first.bytes_read, first.from_cache) == (10, False)
+    assert (again.bytes_read, again.from_cache) == (0, True)
+    assert not other_path.from_cache and not other_format.from_cache
+
+
+def test_cache_waits_for_in_flight_check(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_check(session, resource, prev_check=None):
+        calls.append(resource["url"])
+        started.set()
+        release.wait(5)
+        return result()
+
+    monkeypatch.setattr(bs, "check_resource", slow_check)
+    cache = bs.ResourceCheckCache()
+    results = {}
+
+    owner = threading.Thread(target=lambda: results.setdefault("owner", cache.check(None, {"url": "http://h/x"})))
+    owner.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=lambda: results.setdefault("waiter", cache.check(None, {"url": "http://h/x"})))
+    waiter.start()
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+
+    assert calls == ["http://h/x"]
+    assert results["waiter"].from_cache and results["waiter"].checksum == "c"
+
+
+def test_cache_skips_resources_without_url(monkeypatch):
+    monkeypatch.setattr(bs, "check_resource", lambda s, r, p=None: result(ok=False, error="missing url"))
+    cache = bs.ResourceCheckCache()
+    assert not cache.check(None, {}).from_cache
+    assert not cache.check(None, {}).from_cache
+
+
+def fake_download(status, content=b"", etag=None):
+    seen = {}
+
+    def headish_download(session, url, max_bytes=0, headers=None):
+        seen["headers"] = headers
+        return status, bytearray(content), etag
+
+    return headish_download, seen
+
+
+PREV = {
+    "ok": False,
+    "http_status": 200,
+    "error": "parse_failed",
+    "bytes_read": 512,
+    "parse_ok": False,
+    "parse_error": "bad",
+    "checksum": "old",
+    "etag": '"v1"',
+}
+
+
+def test_not_modified_reuses_previous_check(monkeypatch):
+    download, seen = fake_download(304, etag='"v1"')
+    monkeypatch.setattr(bs, "headish_download", download)
+
+    chk = bs.check_resource(None, {"url": "http://h/x.json", "format": "json"}, dict(PREV))
+
+    assert seen["headers"] == {"If-None-Match": '"v1"'}
+    assert (chk.ok, chk.error, chk.parse_error, chk.checksum) == (False, "parse_failed", "bad", "old")
+    assert chk.bytes_read == 0 and chk.etag == '"v1"' and chk.checksum_algo == "sha256"
+
+
+def test_modified_resource_is_checked_again(monkeypatch):
+    download, seen = fake_download(200, b'{"a": 1}', etag='"v2"')
+    monkeypatch.setattr(bs, "headish_download", download)
+
+    chk = bs.check_resource(None, {"url": "http://h/x.json", "format": "json"}, dict(PREV))
+
+    assert chk.ok and chk.parse_ok and chk.etag == '"v2"'
+    assert chk.checksum == bs.checksum_sha256(b'{"a": 1}')
+
+
+def test_no_conditional_request_without_etag_or_with_other_algo(monkeypatch):
+    download, seen = fake_download(200, b"x")
+    monkeypatch.setattr(bs, "headish_download", download)
+
+    bs.check_resource(None, {"url": "http://h/x"}, dict(PREV, etag=None))
+    assert seen["headers"] is None
+
+    bs.check_resource(None, {"url": "http://h/x"}, dict(PREV, checksum_algo="blake3"))
+    assert seen["headers"] is None
+
+
+def test_previous_checks_keyed_by_canonical_url_and_format():
+    snapshot = {
+        "datasets": [
+            {
+                "resources": [
+                    {"url": "HTTP://H/x.csv#top", "format": "CSV", "last_modified": "t1", "check": dict(PREV)},
+                    {"url": "http://h/x.csv", "format": "csv", "check": dict(PREV, checksum="copy", from_cache=True)},
+                    {"url": "http://h/x.csv", "format": "json", "check": dict(PREV, checksum="as-json")},
+                    {"url": "http://h/y.csv", "format": "csv", "check": dict(PREV, checksum="copy", from_cache=True)},
+                    {"url": "http://h/y.csv", "format": "csv", "check": dict(PREV, checksum="real")},
+                ]
+            }
+        ]
+    }
+
+    prev = bs.index_previous_checks(snapshot)
+
+    lookup = bs.resource_check_key({"url": "http://h/x.csv", "format": " csv"})
+    assert prev[lookup] == {"last_modified": "t1", "check": PREV}
+    assert prev[("http://h/x.csv", "json")]["check"]["checksum"] == "as-json"
+    assert prev[("http://h/y.csv", "csv")]["check"]["checksum"] == "real"